@@ -2,75 +2,582 @@ import PIL
 import cv2
 import numpy as np
 import base64
-import io
-from typing import Union, List
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Union, List, Optional, Tuple
 from PIL import Image
 
 
-def video_to_frames(video_path: str, n_frames: int) -> list[PIL.Image]:
+def _ffmpeg_select_cmd(
+    video_path: str,
+    frame_indices: np.ndarray,
+    width: int,
+    height: int,
+    output_args: List[str],
+) -> List[str]:
     """
-    Extract frames from a video file and return them as a list of PIL Images.
+    Build an ffmpeg command that writes only the given frames to stdout.
 
     Args:
         video_path: Path to the video file
-        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        frame_indices: Sorted, unique frame indices to extract
+        width: Output frame width
+        height: Output frame height
+        output_args: ffmpeg output options selecting the format written to stdout
 
     Returns:
-        List of PIL Images containing the extracted frames
+        ffmpeg command line
+    """
+    # Select all target frames in one expression so the video is decoded once
+    # instead of seeking back to a keyframe for every sample; only the
+    # selected frames reach the scaler
+    select_expr = "+".join(f"eq(n\\,{idx})" for idx in frame_indices)
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-v",
+        "error",
+        "-i",
+        video_path,
+        "-vf",
+        f"select='{select_expr}',scale={width}:{height}:flags=area",
+        "-vsync",
+        "0",
+        *output_args,
+        "-",
+    ]
+
+
+def _iter_frames_ffmpeg(
+    video_path: str, frame_indices: np.ndarray, width: int, height: int
+) -> Iterator[np.ndarray]:
+    """
+    Decode the given frame indices from a video in a single ffmpeg pass.
+
+    Frames are yielded as soon as ffmpeg writes them, so consumers can work on
+    one frame while the next is being decoded.
+
+    Args:
+        video_path: Path to the video file
+        frame_indices: Sorted, unique frame indices to extract
+        width: Output frame width
+        height: Output frame height
+
+    Yields:
+        uint8 arrays of shape (height, width, 3) in RGB order. Fewer frames than
+        len(frame_indices) are yielded if the video ends before the last index.
+    """
+    cmd = _ffmpeg_select_cmd(
+        video_path,
+        frame_indices,
+        width,
+        height,
+        ["-f", "rawvideo", "-pix_fmt", "rgb24"],
+    )
+    # stderr goes to a file rather than a pipe: ffmpeg can write more decode
+    # errors than a pipe buffer holds, which would block it while we wait on
+    # stdout
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            # Slice the raw RGB byte stream into frames
+            frame_size = width * height * 3
+            while True:
+                buffer = proc.stdout.read(frame_size)
+                if len(buffer) < frame_size:
+                    break
+                yield np.frombuffer(buffer, dtype=np.uint8).reshape(
+                    height, width, 3
+                )
+
+            if proc.wait() != 0:
+                stderr_file.seek(0)
+                raise subprocess.CalledProcessError(
+                    proc.returncode, cmd, stderr=stderr_file.read()
+                )
+        finally:
+            # Stop ffmpeg if the consumer stopped early
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+
+def _extract_jpegs_ffmpeg(
+    video_path: str, frame_indices: np.ndarray, width: int, height: int, qscale: int
+) -> List[bytes]:
+    """
+    Extract the given frame indices as JPEG images in a single ffmpeg pass.
+
+    Args:
+        video_path: Path to the video file
+        frame_indices: Sorted, unique frame indices to extract
+        width: Output frame width
+        height: Output frame height
+        qscale: MJPEG quality scale (2-31, lower is better)
+
+    Returns:
+        List of JPEG-encoded frames. It may be shorter than frame_indices if
+        the video ends before the last index.
+    """
+    cmd = _ffmpeg_select_cmd(
+        video_path,
+        frame_indices,
+        width,
+        height,
+        [
+            "-f",
+            "image2pipe",
+            "-vcodec",
+            "mjpeg",
+            "-pix_fmt",
+            "yuvj420p",
+            "-q:v",
+            str(qscale),
+        ],
+    )
+    output = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    ).stdout
+
+    return _split_jpeg_stream(output)
+
+
+def _split_jpeg_stream(stream: bytes) -> List[bytes]:
+    """
+    Split concatenated JPEG images, as written by ffmpeg's image2pipe muxer.
+
+    Args:
+        stream: Back-to-back JPEG images
+
+    Returns:
+        List of the individual JPEG images; a trailing truncated image is dropped
+    """
+    # Split at the JPEG start/end of image markers; entropy-coded data
+    # byte-stuffs 0xFF so the end marker is unambiguous
+    jpegs = []
+    start = stream.find(b"\xff\xd8")
+    while start != -1:
+        end = stream.find(b"\xff\xd9", start)
+        if end == -1:
+            break
+        jpegs.append(stream[start : end + 2])
+        start = stream.find(b"\xff\xd8", end + 2)
+
+    return jpegs
+
+
+def _iter_frames_opencv(
+    video_path: str, frame_indices: np.ndarray, width: int, height: int
+) -> Iterator[np.ndarray]:
+    """
+    Decode the given frame indices with OpenCV by reading the video sequentially.
+
+    Used when ffmpeg is not available. Reading forward and keeping only the
+    target frames avoids CAP_PROP_POS_FRAMES seeks, which force the codec to
+    flush and re-decode from the previous keyframe on every sample.
+
+    Args:
+        video_path: Path to the video file
+        frame_indices: Sorted, unique frame indices to extract
+        width: Output frame width
+        height: Output frame height
+
+    Yields:
+        uint8 arrays of shape (height, width, 3) in OpenCV's BGR order. Fewer
+        frames than len(frame_indices) are yielded if the video ends before the
+        last index.
     """
-    # Open the video file
     cap = cv2.VideoCapture(video_path)
 
-    # Get total number of frames in video
+    target_set = set(frame_indices.tolist())
+    last_idx = int(frame_indices[-1])
+
+    try:
+        frame_idx = 0
+        while frame_idx <= last_idx:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            if frame_idx in target_set:
+                if frame.shape[:2] != (height, width):
+                    frame = cv2.resize(
+                        frame, (width, height), interpolation=cv2.INTER_AREA
+                    )
+                yield frame
+            frame_idx += 1
+    finally:
+        # Release video capture
+        cap.release()
+
+
+def _scaled_size(width: int, height: int, max_side: Optional[int]) -> Tuple[int, int]:
+    """
+    Compute the frame size after shrinking its longest side to max_side.
+
+    Frames are never upscaled, and the aspect ratio is preserved.
+    """
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _file_version(video_path: str) -> Optional[int]:
+    """Modification time of a video file, used to invalidate cached results.
+
+    Returns None for sources that are not local files (e.g. stream URLs)."""
+    try:
+        return os.stat(video_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=32)
+def _probe_video(video_path: str, version: Optional[int]) -> Tuple[int, int, int]:
+    """
+    Read a video's frame count and dimensions, caching the result.
+
+    Opening a capture parses the container and probes the codec, so repeated
+    calls for the same file (e.g. a teacher video reused across generators)
+    are served from the cache.
+
+    Args:
+        video_path: Path to the video file
+        version: File version from _file_version, part of the cache key only
+
+    Returns:
+        Tuple of total frames, width and height
+    """
+    cap = cv2.VideoCapture(video_path)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    # Unreadable videos report -1 on some OpenCV versions
+    return max(total_frames, 0), max(width, 0), max(height, 0)
+
+
+def _sample_frame_indices(
+    video_path: str, n_frames: int, max_side: Optional[int]
+) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Work out which frames to extract from a video and at what size.
+
+    Args:
+        video_path: Path to the video file
+        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        max_side: Maximum length of the longest output side, or None
+
+    Returns:
+        Tuple of the requested frame indices, their sorted unique values, and
+        the output width and height
+    """
+    # Probe the video for frame count and dimensions
+    total_frames, width, height = _probe_video(video_path, _file_version(video_path))
+    width, height = _scaled_size(width, height, max_side)
+
+    if total_frames <= 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty, width, height
 
-    # Calculate frame indices to extract
+    # Calculate frame indices to extract; indices repeated when
+    # n_frames > total_frames only need to be decoded once
     frame_indices = np.linspace(0, total_frames - 1, n_frames, dtype=int)
+    return frame_indices, np.unique(frame_indices), width, height
 
-    frames = []
-    for frame_idx in frame_indices:
-        # Set video to desired frame
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
 
-        # Read frame
-        ret, frame = cap.read()
-        if not ret:
-            continue
+def iter_frames(
+    video_path: str, n_frames: int, max_side: Optional[int] = 512
+) -> Iterator[np.ndarray]:
+    """
+    Extract frames from a video file, yielding each one as soon as it is decoded.
+
+    Passing the generator to to_bytes or to_base64 overlaps encoding of earlier
+    frames with decoding of later ones.
+
+    Args:
+        video_path: Path to the video file
+        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        max_side: Downscale frames so their longest side is at most this many
+            pixels, which cuts upload size and VLM tokenization cost. Pass None
+            to keep the original resolution.
 
+    Yields:
+        uint8 arrays of shape (H, W, 3) in RGB order
+    """
+    frames, is_bgr = _iter_sampled_frames(video_path, n_frames, max_side)
+    for frame in frames:
         # Convert BGR to RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if is_bgr else frame
 
-        # Convert to PIL Image
-        pil_image = PIL.Image.fromarray(frame_rgb)
-        frames.append(pil_image)
 
-    # Release video capture
-    cap.release()
+def _iter_sampled_frames(
+    video_path: str, n_frames: int, max_side: Optional[int]
+) -> Tuple[Iterator[np.ndarray], bool]:
+    """
+    Decode the sampled frames with whichever decoder is available.
+
+    Args:
+        video_path: Path to the video file
+        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        max_side: Maximum length of the longest output side, or None
+
+    Returns:
+        Tuple of an iterator over the frames, repeating frames requested more
+        than once (n_frames > total_frames), and whether they are in BGR order
+        (OpenCV) rather than RGB (ffmpeg)
+    """
+    frame_indices, unique_indices, width, height = _sample_frame_indices(
+        video_path, n_frames, max_side
+    )
+    if len(frame_indices) == 0:
+        return iter(()), False
+
+    # Decode every requested frame in one pass
+    if shutil.which("ffmpeg"):
+        decoded = _iter_frames_ffmpeg(video_path, unique_indices, width, height)
+        is_bgr = False
+    else:
+        decoded = _iter_frames_opencv(video_path, unique_indices, width, height)
+        is_bgr = True
+
+    def _repeat(frames: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        repeats = np.unique(frame_indices, return_counts=True)[1]
+        for frame, count in zip(frames, repeats):
+            for _ in range(count):
+                yield frame
+
+    return _repeat(decoded), is_bgr
+
+
+def video_to_frames(
+    video_path: str, n_frames: int, max_side: Optional[int] = 512
+) -> np.ndarray:
+    """
+    Extract frames from a video file and return them as a stacked RGB array.
+
+    Args:
+        video_path: Path to the video file
+        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        max_side: Downscale frames so their longest side is at most this many
+            pixels, which cuts upload size and VLM tokenization cost. Pass None
+            to keep the original resolution.
+
+    Returns:
+        Read-only uint8 array of shape (N, H, W, 3) in RGB order containing the
+        extracted frames. Results are cached, so copy the array before
+        modifying it. Use to_pil to get PIL Images.
+    """
+    return _extract_frames(video_path, _file_version(video_path), n_frames, max_side)
+
+
+@functools.lru_cache(maxsize=4)
+def _extract_frames(
+    video_path: str, version: Optional[int], n_frames: int, max_side: Optional[int]
+) -> np.ndarray:
+    """Cached implementation of video_to_frames; version only keys the cache."""
+    frames, is_bgr = _iter_sampled_frames(video_path, n_frames, max_side)
+    frames = list(frames)
+    if frames:
+        stacked = np.stack(frames)
+        if is_bgr:
+            # Convert BGR to RGB for the whole stack with one cvtColor call,
+            # viewing the frames as a single tall image
+            n, h, w, _ = stacked.shape
+            stacked = cv2.cvtColor(
+                stacked.reshape(n * h, w, 3), cv2.COLOR_BGR2RGB
+            ).reshape(n, h, w, 3)
+    else:
+        _, _, width, height = _sample_frame_indices(video_path, n_frames, max_side)
+        stacked = np.empty((0, height, width, 3), dtype=np.uint8)
+
+    # The array is shared between callers through the cache
+    stacked.flags.writeable = False
+    return stacked
+
+
+def video_to_jpeg_frames(
+    video_path: str, n_frames: int, max_side: Optional[int] = 512, qscale: int = 3
+) -> List[bytes]:
+    """
+    Extract frames from a video file as JPEG-encoded bytes.
 
-    return frames
+    With ffmpeg available the frames are encoded by ffmpeg's MJPEG encoder in
+    the same pass that decodes them, so they never round-trip through RGB
+    arrays before being JPEG-encoded for the VLM.
+
+    Args:
+        video_path: Path to the video file
+        n_frames: Number of frames to extract (evenly spaced throughout the video)
+        max_side: Downscale frames so their longest side is at most this many
+            pixels. Pass None to keep the original resolution.
+        qscale: MJPEG quality scale (2-31, lower is better); only used by the
+            ffmpeg path, the OpenCV fallback encodes with to_bytes defaults
+
+    Returns:
+        List of JPEG-encoded frames
+    """
+    return list(
+        _extract_jpeg_frames(
+            video_path, _file_version(video_path), n_frames, max_side, qscale
+        )
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _extract_jpeg_frames(
+    video_path: str,
+    version: Optional[int],
+    n_frames: int,
+    max_side: Optional[int],
+    qscale: int,
+) -> Tuple[bytes, ...]:
+    """Cached implementation of video_to_jpeg_frames; version only keys the cache."""
+    if not shutil.which("ffmpeg"):
+        return tuple(to_bytes(iter_frames(video_path, n_frames, max_side)))
+
+    frame_indices, unique_indices, width, height = _sample_frame_indices(
+        video_path, n_frames, max_side
+    )
+    if len(frame_indices) == 0:
+        return ()
+
+    jpegs = _extract_jpegs_ffmpeg(video_path, unique_indices, width, height, qscale)
+
+    # Map each requested index to its encoded frame, skipping frames past the
+    # end of what the decoder could read
+    positions = np.searchsorted(unique_indices, frame_indices)
+    return tuple(jpegs[pos] for pos in positions if pos < len(jpegs))
+
+
+def to_pil(frames: np.ndarray) -> list[PIL.Image]:
+    """
+    Convert a stack of RGB frames to PIL Images.
+
+    Args:
+        frames: uint8 array of shape (N, H, W, 3), as returned by video_to_frames
+
+    Returns:
+        List of PIL Images, one per frame
+    """
+    # Hand the array's buffer straight to Pillow: passing frame.tobytes() would
+    # add a copy, and fromarray only dispatches to frombuffer anyway. Pillow
+    # stores RGB with 4 bytes per pixel, so it still unpacks into its own
+    # buffer; frames are made C-contiguous (a no-op for video_to_frames output)
+    return [
+        PIL.Image.frombuffer(
+            "RGB",
+            (frame.shape[1], frame.shape[0]),
+            np.ascontiguousarray(frame),
+            "raw",
+            "RGB",
+            0,
+            1,
+        )
+        for frame in frames
+    ]
+
+
+def _is_batch(images) -> bool:
+    """Whether images holds several images rather than a single one."""
+    return isinstance(images, (list, tuple, Iterator)) or (
+        isinstance(images, np.ndarray) and images.ndim == 4
+    )
+
+
+def to_bytes(
+    images: Union[Image.Image, np.ndarray, Iterable[Union[Image.Image, np.ndarray]]],
+    format: str = "JPEG",
+    quality: int = 80,
+) -> Union[bytes, List[bytes]]:
+    """
+    Encode image(s) to compressed image bytes.
+
+    Args:
+        images: Single image or several images, as PIL Images, RGB uint8 arrays,
+            a stacked (N, H, W, 3) array or an iterator such as iter_frames
+        format: Image format for encoding ('JPEG', 'PNG', etc.)
+        quality: JPEG quality (0-100); ignored for other formats
+
+    Returns:
+        Single encoded image or list of encoded images
+    """
+    ext = ".jpg" if format.upper() in ("JPEG", "JPG") else f".{format.lower()}"
+    params = []
+    if ext == ".jpg":
+        # Baseline, non-optimized JPEG with 4:2:0 chroma subsampling: skips the
+        # extra Huffman pass and keeps chroma payload small
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY,
+            quality,
+            cv2.IMWRITE_JPEG_OPTIMIZE,
+            0,
+            cv2.IMWRITE_JPEG_PROGRESSIVE,
+            0,
+        ]
+        if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+            params += [
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+            ]
+
+    def _single_image_to_bytes(image: Union[Image.Image, np.ndarray]) -> bytes:
+        if isinstance(image, Image.Image):
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image = np.asarray(image)
+
+        # OpenCV encodes BGR; single-channel images are passed through as-is
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+        ok, buffer = cv2.imencode(ext, image, params)
+        if not ok:
+            raise ValueError(f"Failed to encode image as {format}")
+        return buffer.tobytes()
+
+    if _is_batch(images):
+        # cv2 releases the GIL while encoding, so threads scale across cores.
+        # Frames from an iterator are submitted as they are produced, so
+        # encoding overlaps with decoding of the remaining frames
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return list(executor.map(_single_image_to_bytes, images))
+    else:
+        return _single_image_to_bytes(images)
 
 
 def to_base64(
-    images: Union[Image.Image, List[Image.Image]], format: str = "JPEG"
+    images: Union[Image.Image, np.ndarray, Iterable[Union[Image.Image, np.ndarray]]],
+    format: str = "JPEG",
+    quality: int = 80,
 ) -> Union[str, List[str]]:
     """
-    Convert PIL Image(s) to base64 string(s).
+    Convert image(s) to base64 string(s).
 
     Args:
-        images: Single PIL Image or list of PIL Images
+        images: Single image or several images, as PIL Images, RGB uint8 arrays,
+            a stacked (N, H, W, 3) array or an iterator such as iter_frames
         format: Image format for encoding ('JPEG', 'PNG', etc.)
+        quality: JPEG quality (0-100); ignored for other formats
 
     Returns:
         Single base64 string or list of base64 strings
     """
 
-    def _single_image_to_base64(image: Image.Image) -> str:
-        buffered = io.BytesIO()
-        image.save(buffered, format=format)
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    def _bytes_to_base64(data: bytes) -> str:
+        img_str = base64.b64encode(data).decode("utf-8")
         return f"data:image/{format.lower()};base64,{img_str}"
 
-    if isinstance(images, list):
-        return [_single_image_to_base64(img) for img in images]
+    encoded = to_bytes(images, format=format, quality=quality)
+    if isinstance(encoded, list):
+        return [_bytes_to_base64(data) for data in encoded]
     else:
-        return _single_image_to_base64(images)
+        return _bytes_to_base64(encoded)
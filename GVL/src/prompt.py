@@ -1,26 +1,43 @@
 """This file contains helper functions for the GVL project."""
 
+import functools
+
+
+@functools.lru_cache(maxsize=32)
+def _format_task_prompts(
+    system_template: str,
+    inference_template: str,
+    teacher_reminder: str,
+    task_desc: str,
+) -> tuple:
+    """Format the task description and inference templates, caching the result
+    for the most recently used tasks. The templates are part of the key so
+    subclasses that override them get their own entries."""
+
+    return (
+        system_template.format(task_description=task_desc),
+        inference_template.format(
+            task_description=task_desc, teacher_reminder_prompt=teacher_reminder
+        ),
+    )
+
 
 class Prompt:
     """This class contains the prompt for the GVL project."""
 
-    def __init__(self):
-        """Initialise the base prompt with variable formatters for:
-        task_desc, teacher examples, inference video
-        All inputs are strings. videos must be base64 encoded as strings."""
-
-        self.system_and_task_desc_prompt = """You are an expert robotics engineer and are training an RL model for which you are labelling data.
+    # Templates are shared by all instances
+    system_and_task_desc_prompt = """You are an expert robotics engineer and are training an RL model for which you are labelling data.
         The task you are training the model for is: {task_description}. You need to create ground truth labels for a video of a robot performing the task.
         You are given multiple frames from a video of a robot performing the task. For each frame, you need to predict the task completion percentage, which represents how close the robot is to completing the task.
         The task completion percentages are between 0 and 100, where 100 corresponds to full task completion. In the initial robot scene, the task completion percentage is 0.
         """
 
-        self.teacher_examples_prompt = """
+    teacher_examples_prompt = """
         Here are some references of of an ideal success video for the task. Remember, these are ideal cases and progress will be monotonic, but for the inference video, progress might not be monotonic as failure cases can be there.
         Reference videos:
         """
 
-        self.inference_video_prompt = """
+    inference_video_prompt = """
         Now, for the task of '{task_description}', output the task completion percentage for each frame. 
         {teacher_reminder_prompt}
         For each frame, format your response as follow: 
@@ -33,37 +50,78 @@ class Prompt:
         Inference video:
         """
 
-        self.teacher_reminder_prompt = """Compare each frame to the corresponding frame(position wise) in the ideal success scenarios and make a judgement on the task completion percentage."""
+    teacher_reminder_prompt = """Compare each frame to the corresponding frame(position wise) in the ideal success scenarios and make a judgement on the task completion percentage."""
+
+    def __init__(self):
+        """Initialise the base prompt with variable formatters for:
+        task_desc, teacher examples, inference video
+        The task description is a string. For format_prompt, frames must be
+        base64 encoded strings; format_contents accepts any frame object (e.g.
+        PIL Images or {"mime_type", "data"} image parts) and keeps it as its own
+        part. The templates are class attributes; the task-specific text formatted
+        from them is cached for recently used task descriptions."""
 
         self.final_prompt = """"""
 
-    def format_prompt(
+    def _format_task_prompts(self, task_desc: str, with_teachers: bool) -> tuple:
+        """Format the task description and inference templates, reusing the
+        result for repeated calls with the same task."""
+
+        return _format_task_prompts(
+            self.system_and_task_desc_prompt,
+            self.inference_video_prompt,
+            self.teacher_reminder_prompt if with_teachers else "",
+            task_desc,
+        )
+
+    def format_contents(
         self,
         task_desc: str,
-        inference_video: list[str],
-        teacher_examples: list[list[str]] = None,
-    ) -> str:  # type: ignore
-        """Format the prompt for the given task description, teacher examples and inference video."""
+        inference_video: list,
+        teacher_examples: list[list] = None,
+    ) -> list:  # type: ignore
+        """Format the prompt as a list of parts for multimodal APIs.
+
+        Frames are kept as separate parts between the text segments, so they can
+        be images (e.g. PIL Images) passed straight to the model rather than
+        base64 strings embedded in the text."""
 
-        self.final_prompt = self.system_and_task_desc_prompt.format(
-            task_description=task_desc
+        task_prompt, inference_prompt = self._format_task_prompts(
+            task_desc, bool(teacher_examples)
         )
+        parts = [task_prompt]
 
         if teacher_examples:
-            self.final_prompt += self.teacher_examples_prompt
+            parts.append(self.teacher_examples_prompt)
 
             for ix, example in enumerate(teacher_examples):
-                self.final_prompt += f"Reference Video {ix + 1}:\n"
-                for frame in example:
-                    self.final_prompt += f"    Frame {ix + 1}: {frame}\n"
-
-        self.final_prompt += self.inference_video_prompt.format(
-            task_description=task_desc,
-            teacher_reminder_prompt=self.teacher_reminder_prompt
-            if teacher_examples
-            else "",
-        )
+                parts.append(f"Reference Video {ix + 1}:\n")
+                for jx, frame in enumerate(example):
+                    parts.extend((f"    Frame {jx + 1}: ", frame, "\n"))
+
+        parts.append(inference_prompt)
 
-        self.final_prompt += self.teacher_reminder_prompt
+        for ix, frame in enumerate(inference_video):
+            parts.extend((f"    Frame {ix + 1}: ", frame, "\n"))
+
+        parts.append(self.teacher_reminder_prompt)
+
+        return parts
+
+    def format_prompt(
+        self,
+        task_desc: str,
+        inference_video: list[str],
+        teacher_examples: list[list[str]] = None,
+    ) -> str:  # type: ignore
+        """Format the prompt for the given task description, teacher examples and inference video."""
+
+        # Join the pieces once; repeated += on multi-kilobyte base64 frames
+        # copies the whole accumulated prompt each time. Frames are separate
+        # parts rather than embedded in f-strings, so each one is copied only
+        # into the joined result, which join sizes up front
+        self.final_prompt = "".join(
+            self.format_contents(task_desc, inference_video, teacher_examples)
+        )
 
         return self.final_prompt
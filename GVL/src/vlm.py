@@ -1,11 +1,25 @@
-from typing import List
-import PIL.Image
-from typing import List
+import asyncio
+import re
+from typing import List, Optional, Union
+import numpy as np
 import PIL.Image
 import google.generativeai as genai
-from .vlm import VLM
 from .prompt import Prompt
-from .helpers import to_base64
+from .helpers import to_bytes
+
+# Text parts interleaved with image parts, as accepted by generate_content
+PromptContents = List[Union[str, PIL.Image.Image, dict]]
+
+# Start-of-image marker that every JPEG file begins with
+_JPEG_SOI = b"\xff\xd8"
+
+# The value of one frame in the model's response, e.g. the end of
+# "Frame: [1] Description: [...]: Task Completion Percentages:10%". Only the
+# percentage is anchored, so entries whose frame header and description are
+# worded or wrapped differently still count, as with line-by-line parsing
+_FRAME_VALUE_PATTERN = re.compile(
+    r"Task Completion Percentages:\s*\[?(?P<value>\d+(?:\.\d+)?)\]?\s*%"
+)
 
 
 class VLM:
@@ -21,19 +35,21 @@ class VLM:
     def format_prompt(
         self,
         task_desc: str,
-        inference_frames: List[PIL.Image.Image],
-        teacher_frames: List[List[PIL.Image.Image]],
-    ) -> str:
+        inference_frames: Union[np.ndarray, List[bytes]],
+        teacher_frames: List[Union[np.ndarray, List[bytes]]],
+    ) -> PromptContents:
         """
         Prepare the formatted prompt for the VLM.
 
         Args:
             task_desc: Description of the evaluation task
-            inference_frames: List of frames to evaluate
-            teacher_frames: List of lists containing teacher example frames
+            inference_frames: Frames to evaluate, as a uint8 RGB array of shape
+                (N, H, W, 3) or a list of JPEG-encoded bytes
+            teacher_frames: List of teacher example videos, each given in the
+                same forms as inference_frames
 
         Returns:
-            Formatted prompt string for the VLM
+            Prompt contents, as text parts interleaved with the frames
         """
         raise NotImplementedError("Subclasses must implement format_prompt method")
 
@@ -69,35 +85,87 @@ class GeminiVLM(VLM):
     def format_prompt(
         self,
         task_desc: str,
-        inference_frames: List[PIL.Image.Image],
-        teacher_frames: List[List[PIL.Image.Image]],
-    ) -> str:
+        inference_frames: Union[np.ndarray, List[bytes]],
+        teacher_frames: List[Union[np.ndarray, List[bytes]]],
+    ) -> PromptContents:
         """
         Prepare the formatted prompt for Gemini.
 
         Args:
             task_desc: Description of the evaluation task
-            inference_frames: List of frames to evaluate
-            teacher_frames: List of lists containing teacher example frames
+            inference_frames: Frames to evaluate, as a uint8 RGB array of shape
+                (N, H, W, 3) or a list of JPEG-encoded bytes
+            teacher_frames: List of teacher example videos, each given in the
+                same forms as inference_frames. Teacher examples are reused for
+                every inference video, so passing them as JPEG bytes from
+                to_bytes avoids re-encoding them on each call.
 
         Returns:
-            Formatted prompt string
+            Prompt contents, as text parts interleaved with the frames
         """
-        # Convert images to base64 strings
-        inference_b64 = to_base64(inference_frames)
-        teacher_b64 = (
-            [to_base64(frames) for frames in teacher_frames] if teacher_frames else None
+        # Send frames as inline JPEG image parts rather than base64 text
+        inference_parts = self._to_image_parts(inference_frames)
+        teacher_parts = (
+            [self._to_image_parts(frames) for frames in teacher_frames]
+            if teacher_frames
+            else None
         )
 
         # Use the Prompt class to format the prompt
-        self.current_prompt = self.prompt_formatter.format_prompt(
+        self.current_prompt = self.prompt_formatter.format_contents(
             task_desc=task_desc,
-            inference_video=inference_b64,
-            teacher_examples=teacher_b64,
+            inference_video=inference_parts,
+            teacher_examples=teacher_parts,
         )
 
         return self.current_prompt
 
+    @staticmethod
+    def _to_image_parts(frames: Union[np.ndarray, List[bytes]]) -> List[dict]:
+        """
+        Encode frames as inline JPEG parts for generate_content.
+
+        Args:
+            frames: uint8 RGB array of shape (N, H, W, 3), a list of frames, or a
+                list or tuple of already encoded JPEG bytes
+
+        Returns:
+            List of {"mime_type", "data"} image parts
+
+        Raises:
+            ValueError: If pre-encoded frames are not JPEG data
+        """
+        # Pre-encoded JPEG frames are sent as they are
+        if isinstance(frames, (list, tuple)) and all(
+            isinstance(f, bytes) for f in frames
+        ):
+            if not all(f[:2] == _JPEG_SOI for f in frames):
+                raise ValueError(
+                    "Pre-encoded frames must be JPEG bytes, e.g. from "
+                    'to_bytes(frames, format="JPEG")'
+                )
+            encoded = frames
+        else:
+            encoded = to_bytes(frames)
+
+        return [{"mime_type": "image/jpeg", "data": data} for data in encoded]
+
+    @staticmethod
+    def _parse_response(text: str) -> List[float]:
+        """
+        Parse the frame values out of a Gemini response.
+
+        Args:
+            text: Raw response text from the model
+
+        Returns:
+            List of computed values for each frame
+        """
+        return [
+            float(match.group("value")) / 100.0  # Convert percentage to 0-1
+            for match in _FRAME_VALUE_PATTERN.finditer(text)
+        ]
+
     def call_VLM(self) -> List[float]:
         """
         Call the Gemini model and parse the response for frame values.
@@ -112,17 +180,225 @@ class GeminiVLM(VLM):
         response = self.model.generate_content(self.current_prompt)
 
         # Parse the response text to extract values
-        values = []
-        for line in response.text.split("\n"):
-            if "Task Completion Percentages:" in line:
-                # Extract percentage value and convert to float
-                try:
-                    value_str = line.split("Task Completion Percentages:")[1].strip()
-                    value = float(value_str.rstrip("%"))
-                    values.append(
-                        value / 100.0
-                    )  # Convert percentage to float between 0 and 1
-                except (ValueError, IndexError):
-                    continue
-
-        return values
+        return self._parse_response(response.text)
+
+    async def call_VLM_async(
+        self, prompt: Optional[PromptContents] = None
+    ) -> List[float]:
+        """
+        Asynchronously call the Gemini model and parse the response for frame values.
+
+        Args:
+            prompt: Formatted prompt to send. Defaults to the current prompt.
+
+        Returns:
+            List of computed values for each frame
+        """
+        prompt = prompt if prompt is not None else self.current_prompt
+        if not prompt:
+            raise ValueError("Prompt must be formatted before calling VLM")
+
+        response = await self.model.generate_content_async(prompt)
+        return self._parse_response(response.text)
+
+    async def call_VLM_batch_async(
+        self, prompts: List[PromptContents], max_concurrency: int = 8
+    ) -> List[List[float]]:
+        """
+        Call the Gemini model concurrently for several formatted prompts.
+
+        Args:
+            prompts: Formatted prompts, e.g. one per inference video
+            max_concurrency: Maximum number of requests in flight at once
+
+        Returns:
+            List of per-frame values for each prompt, in input order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _bounded_call(prompt: PromptContents) -> List[float]:
+            async with semaphore:
+                return await self.call_VLM_async(prompt)
+
+        return list(await asyncio.gather(*(_bounded_call(p) for p in prompts)))
+
+    def call_VLM_batch(
+        self, prompts: List[PromptContents], max_concurrency: int = 8
+    ) -> List[List[float]]:
+        """
+        Synchronous wrapper around call_VLM_batch_async.
+
+        This starts its own event loop, so it cannot be called while one is
+        already running (e.g. in a notebook or an async training loop); await
+        call_VLM_batch_async there instead.
+
+        Args:
+            prompts: Formatted prompts, e.g. one per inference video
+            max_concurrency: Maximum number of requests in flight at once
+
+        Returns:
+            List of per-frame values for each prompt, in input order
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.call_VLM_batch_async(prompts, max_concurrency))
+
+        raise RuntimeError(
+            "call_VLM_batch cannot be used inside a running event loop; "
+            "await call_VLM_batch_async instead"
+        )
+
+
+class RequestBatcher:
+    """
+    Micro-batching request queue in front of GeminiVLM.call_VLM_async.
+
+    Concurrent callers submit prompts to a bounded queue. A background worker
+    collects up to max_batch_size prompts, or whatever arrived within max_wait
+    seconds of the first one, and dispatches them to Gemini together. Each
+    caller's result is routed back through its own future.
+
+    At most max_concurrent_batches batches are in flight at once, so no more
+    than max_concurrent_batches * max_batch_size requests reach the API
+    together. Once that limit is hit the worker stops taking from the queue,
+    and submit blocks when the queue is full.
+    """
+
+    def __init__(
+        self,
+        vlm: GeminiVLM,
+        max_batch_size: int = 8,
+        max_wait: float = 0.05,
+        max_queue_size: int = 64,
+        max_concurrent_batches: int = 2,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            vlm: Gemini VLM used to serve the requests
+            max_batch_size: Maximum number of prompts dispatched together
+            max_wait: Seconds to wait for a batch to fill after its first prompt
+            max_queue_size: Maximum number of queued prompts before submit blocks
+            max_concurrent_batches: Maximum number of batches in flight at once
+        """
+        self.vlm = vlm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue = None
+        self._batch_slots = None
+        self._worker = None
+        self._in_flight = set()
+        self._closed = False
+
+    async def submit(self, prompt: PromptContents) -> List[float]:
+        """
+        Queue a formatted prompt and wait for its frame values.
+
+        Args:
+            prompt: Formatted prompt, as returned by GeminiVLM.format_prompt
+
+        Returns:
+            List of computed values for each frame
+
+        Raises:
+            RuntimeError: If the batcher is closed, or is closed before the
+                request is sent
+        """
+        if self._closed:
+            raise RuntimeError("RequestBatcher is closed")
+
+        # Start the worker lazily so it runs on the caller's event loop. A
+        # stopped worker (e.g. its event loop ended) has already failed
+        # everything left in its queue, so a fresh queue can replace it
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.create_task(self._run(self._queue))
+        worker, queue = self._worker, self._queue
+
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((prompt, future))
+
+        # The worker may have stopped while this caller waited for queue space;
+        # draining also wakes any other caller still blocked on the queue
+        if worker.done():
+            self._fail_queued(queue)
+        return await future
+
+    async def close(self) -> None:
+        """
+        Stop the worker and wait for dispatched batches to finish.
+
+        Requests that have not been sent yet fail with RuntimeError, and later
+        calls to submit are refused.
+        """
+        self._closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """Collect micro-batches from the queue and dispatch them."""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                # Wait for a free batch slot before taking more work, so callers
+                # feel backpressure through the bounded queue
+                await self._batch_slots.acquire()
+                batch = [await queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Dispatch without waiting so the next batch can start filling
+                task = asyncio.create_task(self._dispatch(batch, self._batch_slots))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+                batch = []
+        finally:
+            # Fail requests collected into an undispatched batch or still
+            # queued, so their callers do not wait forever
+            self._fail_queued(queue, batch)
+
+    @staticmethod
+    def _fail_queued(queue: asyncio.Queue, batch: list = ()) -> None:
+        """Fail the given requests and everything left in the queue."""
+        pending = list(batch)
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(
+                    RuntimeError("RequestBatcher closed before sending the request")
+                )
+
+    async def _dispatch(self, batch: list, batch_slots: asyncio.Semaphore) -> None:
+        """Send one micro-batch to Gemini and resolve the callers' futures."""
+        try:
+            results = await asyncio.gather(
+                *(self.vlm.call_VLM_async(prompt) for prompt, _ in batch),
+                return_exceptions=True,
+            )
+        finally:
+            batch_slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,137 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from GVL.src.helpers import (
+    _split_jpeg_stream,
+    iter_frames,
+    to_bytes,
+    video_to_frames,
+    video_to_jpeg_frames,
+)
+
+N_CLIP_FRAMES = 10
+
+
+def write_clip(path, offset=0, size=(64, 48)):
+    """Write a clip whose frame i is solid RGB (20 * i + 10 + offset, 0, 200)."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, size)
+    for i in range(N_CLIP_FRAMES):
+        frame = np.zeros((size[1], size[0], 3), np.uint8)
+        frame[..., 0] = 200  # blue, as OpenCV writes BGR
+        frame[..., 2] = 20 * i + 10 + offset
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def frame_numbers(frames, offset=0):
+    """Recover each frame's index in the clip from its red channel."""
+    return [round((int(f[..., 0].mean()) - 10 - offset) / 20) for f in frames]
+
+
+@pytest.fixture(params=["ffmpeg", "opencv"])
+def decoder(request, monkeypatch):
+    """Run a test on both the ffmpeg path and the OpenCV fallback."""
+    if request.param == "ffmpeg":
+        if not shutil.which("ffmpeg"):
+            pytest.skip("ffmpeg is not installed")
+    else:
+        monkeypatch.setattr(shutil, "which", lambda name: None)
+    return request.param
+
+
+@pytest.mark.parametrize("n_frames", [4, 15])
+def test_video_to_frames_samples_evenly_in_order(tmp_path, decoder, n_frames):
+    clip = write_clip(tmp_path / "clip.avi")
+
+    frames = video_to_frames(clip, n_frames)
+
+    assert frames.shape == (n_frames, 48, 64, 3)
+    # Indices repeat when more frames are requested than the clip has
+    expected = np.linspace(0, N_CLIP_FRAMES - 1, n_frames, dtype=int)
+    assert frame_numbers(frames) == expected.tolist()
+
+
+def test_video_to_frames_returns_rgb(tmp_path, decoder):
+    frames = video_to_frames(write_clip(tmp_path / "clip.avi"), 3)
+
+    red, green, blue = frames[-1, ..., 0], frames[-1, ..., 1], frames[-1, ..., 2]
+    assert abs(int(red.mean()) - 190) <= 3
+    assert green.max() <= 3
+    assert abs(int(blue.mean()) - 200) <= 3
+
+
+def test_video_to_frames_downscales_to_max_side(tmp_path, decoder):
+    clip = write_clip(tmp_path / "clip.avi")
+
+    assert video_to_frames(clip, 2, max_side=32).shape == (2, 24, 32, 3)
+    assert video_to_frames(clip, 2, max_side=None).shape == (2, 48, 64, 3)
+
+
+def test_iter_frames_matches_video_to_frames(tmp_path, decoder):
+    clip = write_clip(tmp_path / "clip.avi")
+
+    streamed = np.stack(list(iter_frames(clip, 15, max_side=32)))
+
+    np.testing.assert_array_equal(streamed, video_to_frames(clip, 15, max_side=32))
+
+
+def test_video_to_frames_rereads_a_rewritten_file(tmp_path, decoder):
+    clip = write_clip(tmp_path / "clip.avi")
+    before = video_to_frames(clip, 4)
+
+    write_clip(clip, offset=5)
+    # Make sure the modification time changes on coarse-grained filesystems
+    stat = os.stat(clip)
+    os.utime(clip, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    after = video_to_frames(clip, 4)
+    assert frame_numbers(after, offset=5) == frame_numbers(before)
+    assert abs(int(after[..., 0].mean()) - int(before[..., 0].mean()) - 5) <= 2
+
+
+@pytest.mark.parametrize("n_frames", [4, 15])
+def test_video_to_jpeg_frames_matches_decoded_frames(tmp_path, decoder, n_frames):
+    clip = write_clip(tmp_path / "clip.avi")
+
+    jpegs = video_to_jpeg_frames(clip, n_frames, max_side=32)
+
+    decoded = [
+        cv2.cvtColor(
+            cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR),
+            cv2.COLOR_BGR2RGB,
+        )
+        for jpeg in jpegs
+    ]
+    assert all(frame.shape == (24, 32, 3) for frame in decoded)
+    assert frame_numbers(decoded) == frame_numbers(video_to_frames(clip, n_frames))
+
+
+def test_split_jpeg_stream_recovers_each_image():
+    frames = np.random.default_rng(0).integers(0, 256, (3, 16, 24, 3), np.uint8)
+    jpegs = to_bytes(frames)
+
+    assert _split_jpeg_stream(b"".join(jpegs)) == jpegs
+
+
+def test_split_jpeg_stream_drops_truncated_tail():
+    jpegs = to_bytes(np.zeros((2, 8, 8, 3), np.uint8))
+    stream = b"".join(jpegs) + jpegs[0][:-10]
+
+    assert _split_jpeg_stream(stream) == jpegs
+
+
+@pytest.mark.parametrize("container", [list, tuple, iter])
+def test_to_bytes_encodes_each_image_in_a_collection(container):
+    frames = np.zeros((3, 8, 8, 3), np.uint8)
+
+    encoded = to_bytes(container(frames))
+
+    assert isinstance(encoded, list) and len(encoded) == 3
+    assert to_bytes(frames) == encoded
+    assert isinstance(to_bytes(frames[0]), bytes)
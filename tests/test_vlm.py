@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from GVL.src.prompt import Prompt
+from GVL.src.vlm import GeminiVLM, RequestBatcher
+
+
+class StubVLM:
+    """Stands in for GeminiVLM, echoing prompts and tracking concurrency."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def call_VLM_async(self, prompt):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if prompt == "fail":
+                raise ValueError("bad prompt")
+            return [prompt]
+        finally:
+            self.in_flight -= 1
+
+
+def test_batcher_routes_results_to_callers():
+    async def run():
+        batcher = RequestBatcher(StubVLM(), max_batch_size=3)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.close()
+        return results
+
+    assert asyncio.run(run()) == [[i] for i in range(10)]
+
+
+def test_batcher_routes_exceptions_to_their_caller():
+    async def run():
+        batcher = RequestBatcher(StubVLM(), max_batch_size=4)
+        results = await asyncio.gather(
+            batcher.submit(1),
+            batcher.submit("fail"),
+            batcher.submit(2),
+            return_exceptions=True,
+        )
+        await batcher.close()
+        return results
+
+    ok_1, failed, ok_2 = asyncio.run(run())
+    assert ok_1 == [1] and ok_2 == [2]
+    assert isinstance(failed, ValueError)
+
+
+def test_batcher_bounds_requests_in_flight():
+    vlm = StubVLM()
+
+    async def run():
+        batcher = RequestBatcher(
+            vlm, max_batch_size=4, max_queue_size=4, max_concurrent_batches=2
+        )
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(101)))
+        await batcher.close()
+        return results
+
+    assert asyncio.run(run()) == [[i] for i in range(101)]
+    assert vlm.peak_in_flight <= 8
+
+
+def test_batcher_close_fails_pending_callers():
+    async def run():
+        batcher = RequestBatcher(
+            StubVLM(delay=0.2),
+            max_batch_size=2,
+            max_queue_size=2,
+            max_concurrent_batches=1,
+        )
+        tasks = [asyncio.create_task(batcher.submit(i)) for i in range(9)]
+        await asyncio.sleep(0.1)
+        await batcher.close()
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout=2
+        )
+        with pytest.raises(RuntimeError):
+            await batcher.submit("late")
+        return results
+
+    results = asyncio.run(run())
+    # The dispatched batch completes; everything else fails instead of hanging
+    assert results[:2] == [[0], [1]]
+    assert all(isinstance(r, RuntimeError) for r in results[2:])
+
+
+def test_parse_response_extracts_values():
+    text = (
+        "Frame: [1] Description: [arm at rest]: Task Completion Percentages:0%\n"
+        "Frame: [2] Frame Description: [grasping]: Task Completion Percentages: 42.5%\n"
+        "**Frame 3:** Description: done: Task Completion Percentages:100%\n"
+        "Frame 4 was skipped\n"
+    )
+
+    assert GeminiVLM._parse_response(text) == [0.0, 0.425, 1.0]
+    # Entries wrapped over several lines or without a "Frame" header
+    assert GeminiVLM._parse_response(
+        "Frame: [1]\nDescription: x\nTask Completion Percentages: 10%"
+    ) == [0.1]
+    assert GeminiVLM._parse_response(
+        "1. Description: x Task Completion Percentages: 10%"
+    ) == [0.1]
+
+
+def test_format_contents_numbers_frames_within_each_video():
+    contents = Prompt().format_contents(
+        "stack blocks", ["i1", "i2"], teacher_examples=[["a1", "a2"], ["b1", "b2"]]
+    )
+
+    def label_of(frame):
+        return contents[contents.index(frame) - 1].strip()
+
+    assert [label_of(f) for f in ("a1", "a2", "b1", "b2", "i1", "i2")] == [
+        "Frame 1:",
+        "Frame 2:",
+        "Frame 1:",
+        "Frame 2:",
+        "Frame 1:",
+        "Frame 2:",
+    ]
+
+
+def test_image_parts_pass_jpeg_bytes_through_and_reject_other_formats():
+    jpeg = b"\xff\xd8jpeg data\xff\xd9"
+
+    parts = GeminiVLM._to_image_parts((jpeg, jpeg))
+    assert parts == [{"mime_type": "image/jpeg", "data": jpeg}] * 2
+
+    with pytest.raises(ValueError):
+        GeminiVLM._to_image_parts([b"\x89PNG\r\n\x1a\n"])